@@ -13,9 +13,25 @@ game board. However, the game will by default be played on a 4 by 4 grid.
 __author__ = "Allan Zhou"
 
 
+import builtins
+import json
+import sqlite3
+import sys
+from argparse import ArgumentParser
+from collections import deque
+from getpass import getuser
+from itertools import permutations
+from math import ceil
+from multiprocessing import Pool
+from os import cpu_count
+from os import environ
+from os import getpid
+from random import Random
 from random import randint 
 from random import random
+from time import perf_counter
 from time import sleep
+from time import time
 
 
 # Graphics Constants
@@ -51,6 +67,46 @@ MOVES_ESDF = {"up": "e",
               "right": "f", 
               "quit": "q"}
 
+# Replay Constants
+REPLAY_CHUNK_SIZE = 256
+REPLAY_CHUNKS_PER_PROCESS = 2
+MINED_EMPTY_TILES = 2
+REPLAY_FILE = "2048_replays.jsonl"
+REPLAY_SEED_LIMIT = 2 ** 32 - 1
+
+# Score Store Constants
+SCORE_STORE_FILE = "2048_scores.db"
+SCORE_STORE_TIMEOUT = 30
+LEADERBOARD_SIZE = 5
+DEFAULT_PLAYER = "player"
+SCORE_TREE_SIZE = 2 ** 26
+
+# Monte Carlo Player Constants
+MOVE_DIRECTIONS = ["up", "left", "down", "right"]
+MOVE_ORDERS = list(permutations(MOVE_DIRECTIONS))
+PACKED_BOARD_SIDE_LENGTH = 4
+PACKED_MAX_EXPONENT = 15
+PACKED_ROW_MASK = 0xFFFF
+PACKED_CELL_LOW_BITS = 0x1111111111111111
+# A little fewer playouts than one process runs in the time budget.
+MONTE_CARLO_PLAYOUTS = 3000
+MONTE_CARLO_DEPTH_CAP = 200
+MONTE_CARLO_TIME_BUDGET = 1.0
+
+# Profiling Constants
+PROFILED_FUNCTIONS = ["game_board_move", "add_random_tile", "game_outcome",
+                      "print_board", "input", "sleep"]
+PROFILE_ENVIRONMENT_VARIABLE = "PROFILE_2048"
+PROFILE_TRACE_FILE = "2048_trace.json"
+PROFILE_TRACE_LIMIT = 1000000
+
+# Profiling State, which is only filled in while profiling is enabled.
+_unprofiled_functions = {}
+_profile_timers = {}
+_profile_retries = {}
+_profile_trace = None
+_tile_retries = None
+
 
 def choose_key_bind(key_bind_mode: dict) -> dict: 
     """Return the user's choice for the keybinding used to perform moves 
@@ -374,12 +430,21 @@ def merge_game_board(game_tiles: list, upwards: bool) -> tuple:
     return merged_tiles, merge_score
 
 
-def add_random_tile(game_tiles: list) -> list:
+def add_random_tile(game_tiles: list, rng: Random = None) -> list:
     """Add a 2 or 4 tile to the grid, game_tiles, at a random empty tile.
     There is a 90 percent chance of adding a 2 tile and a 10 percent chance 
-    of adding a 4 tile. Return game_tiles after a tile is added."""
+    of adding a 4 tile. The random numbers are drawn from the random number
+    generator rng, or from the random module if rng is None. Return 
+    game_tiles after a tile is added."""
+
+    if rng is None:
+        random_number = random
+        random_integer = randint
+    else:
+        random_number = rng.random
+        random_integer = rng.randint
 
-    new_tile = random() 
+    new_tile = random_number() 
 
     if new_tile > TILE_CHANCE_4: 
         random_tile = TILE_BASE ** 2 
@@ -387,14 +452,22 @@ def add_random_tile(game_tiles: list) -> list:
         random_tile = TILE_BASE
 
     # Place new tile in random, empty tile spot. 
+    retries = 0
     while True:
-        row = randint(0, BOARD_SIDE_LENGTH - 1)
-        col = randint(0, BOARD_SIDE_LENGTH - 1)
+        row = random_integer(0, BOARD_SIDE_LENGTH - 1)
+        col = random_integer(0, BOARD_SIDE_LENGTH - 1)
 
         if game_tiles[row][col] == 0:
             game_tiles[row][col] = random_tile
+
+            # Count how many spots were drawn before an empty one was found.
+            if _tile_retries is not None:
+                _tile_retries[retries] = _tile_retries.get(retries, 0) + 1
+
             return game_tiles
 
+        retries += 1
+
 
 def check_tile(game_tiles: list, value: int) -> bool:
     """Return True if value is in the game board, game_tiles. Otherwise, 
@@ -414,6 +487,24 @@ def check_tile(game_tiles: list, value: int) -> bool:
     return False
 
 
+def get_max_tile(game_tiles: list) -> int:
+    """Return the largest tile in the game board, game_tiles.
+
+    >>> get_max_tile([[2, 0, 0, 0], 
+                      [0, 0, 64, 0], 
+                      [0, 0, 0, 0],
+                      [0, 8, 0, 0]])
+    64
+    """
+
+    max_tile = EMPTY_TILE
+
+    for row in game_tiles:
+        max_tile = max(max_tile, max(row))
+
+    return max_tile
+
+
 def move_up(game_tiles: list) -> tuple:
     """Perform one move of the game board, game_tiles, upwards. One move 
     upwards consists of two upwards tile shifts, with one upwards tile 
@@ -496,34 +587,73 @@ def game_board_move(game_tiles: list, direction: str,
       [0, 0, 0, 0]], 4)
     """
 
-    moved_tiles = game_tiles
+    move_direction = get_move_direction(direction, key_bind_mode)
+    moved_tiles, score = shift_game_board(game_tiles, move_direction)
+
+    # The game board did not change after the move was performed. 
+    if moved_tiles == game_tiles:
+        print("The move {}wards does not move any tiles.\n"
+              .format(move_direction))
+
+    return moved_tiles, score
+
+
+def get_move_direction(direction: str, key_bind_mode: dict) -> str:
+    """Return the name of the move ("up", "down", "left" or "right") bound to
+    the key direction in key_bind_mode. Keys that are not bound to up, down,
+    or left are treated as a move rightwards.
+
+    >>> get_move_direction("s", {"up" : "w",
+                                 "left" : "a",
+                                 "down" : "s",
+                                 "right" : "d", 
+                                 "quit" : "q"})
+    "down"
+    """
 
     if direction == key_bind_mode["up"]:
+        return "up"
+    elif direction == key_bind_mode["down"]:
+        return "down"
+    elif direction == key_bind_mode["left"]:
+        return "left"
+    else:
+        return "right"
+
+
+def shift_game_board(game_tiles: list, move_direction: str) -> tuple:
+    """Perform one move of the game board, game_tiles, in the direction named
+    by move_direction ("up", "down", "left" or "right") without printing 
+    anything. Return the game tiles after the move and the points earned from
+    the move.
+
+    >>> shift_game_board([[2, 2, 0, 2], 
+                          [0, 4, 0, 0], 
+                          [0, 0, 0, 0], 
+                          [0, 0, 0, 0]], "left")
+    ([[4, 2, 0, 0], 
+      [4, 0, 0, 0], 
+      [0, 0, 0, 0], 
+      [0, 0, 0, 0]], 4)
+    """
+
+    if move_direction == "up":
         moved_tiles, score = move_up(game_tiles)
-        move_direction = "up"
 
     # A move downwards is a reflected move upwards.
-    elif direction == key_bind_mode["down"]:
+    elif move_direction == "down":
         moved_tiles = reflect_game_board(game_tiles, True)
         moved_tiles, score = move_up(moved_tiles)
         moved_tiles = reflect_game_board(moved_tiles, True)
-        move_direction = "down"
 
-    elif direction == key_bind_mode["left"]:
+    elif move_direction == "left":
         moved_tiles, score = move_left(game_tiles)
-        move_direction = "left"
 
     # A move rightwards is a reflected move leftwards.
     else:
         moved_tiles = reflect_game_board(game_tiles, False)
         moved_tiles, score = move_left(moved_tiles)
         moved_tiles = reflect_game_board(moved_tiles, False)
-        move_direction = "right"
-
-    # The game board did not change after the move was performed. 
-    if moved_tiles == game_tiles:
-        print("The move {}wards does not move any tiles.\n"
-              .format(move_direction))
 
     return moved_tiles, score
 
@@ -579,18 +709,27 @@ def game_outcome(game_tiles: list, won: bool) -> str:
         return "loss"
 
 
-def game_round(key_bind_mode: dict) -> int:
-    """Play one single round of 2048. Return the score from the round."""
+def game_round(key_bind_mode: dict) -> dict:
+    """Play one single round of 2048. Return the round record made by 
+    get_round_record, which has the score from the round and everything 
+    needed to replay it."""
 
     # When two tiles are merged, the value of their sum is added to the score.
     round_score = 0
+    move_count = 0
+    moves = []
     won = False
+    won_before_move = False
 
+    # The random tiles come from a generator of their own, seeded so the 
+    # round can be replayed from its moves.
+    round_seed = randint(0, REPLAY_SEED_LIMIT)
+    round_rng = Random(round_seed)
     game_tiles = generate_empty_board()
 
     # Start with 2 tiles, which are either 2 or 4. 
     for i in range(STARTING_TILES):
-        game_tiles = add_random_tile(game_tiles)
+        game_tiles = add_random_tile(game_tiles, round_rng)
 
     print_key_bind(key_bind_mode)
     print_board(game_tiles)
@@ -607,7 +746,8 @@ def game_round(key_bind_mode: dict) -> int:
                 if choice == QUIT:
                     print("\nExiting Game...\n")
                     sleep(TIME_DELAY)
-                    return round_score
+                    return get_round_record(round_seed, moves, round_score, 
+                        game_tiles, won_before_move, move_count)
                 elif choice == PLAY:
                     print()
                     print_board(game_tiles)
@@ -631,7 +771,8 @@ def game_round(key_bind_mode: dict) -> int:
                 if choice == "y": 
                     print("\nQuitting Game...\n")
                     sleep(TIME_DELAY)
-                    return round_score
+                    return get_round_record(round_seed, moves, round_score, 
+                        game_tiles, won_before_move, move_count)
 
                 elif choice == "n": 
                     # Print the game board and return to top of game loop. 
@@ -648,6 +789,16 @@ def game_round(key_bind_mode: dict) -> int:
 
             round_score += move_score
 
+            # Only moves that change the game board are counted.
+            if new_game_tiles != game_tiles:
+                move_count += 1
+
+            # Moves are recorded with the default keybind, since the keybind
+            # can be changed during the round.
+            moves.append(MOVES_WASD[get_move_direction(move, key_bind_mode)])
+            won_before_move = won_before_move or \
+                check_tile(game_tiles, WINNING_TILE)
+
             # End the game when a seven digit tile has been created.
             if check_tile(game_tiles, MAX_TILE):
                 print("The game has ended.\n")
@@ -658,18 +809,1157 @@ def game_round(key_bind_mode: dict) -> int:
             elif check_tile(new_game_tiles, EMPTY_TILE) and \
                 new_game_tiles != game_tiles:
 
-                game_tiles = add_random_tile(new_game_tiles)
+                game_tiles = add_random_tile(new_game_tiles, round_rng)
             
             print_board(new_game_tiles)
 
     if not won: 
         print("Sorry, you lost the game. Better luck next time.\n")
 
-    return round_score
+    return get_round_record(round_seed, moves, round_score, game_tiles, 
+                            won_before_move, move_count)
+
+
+def get_round_record(round_seed: int, moves: list, round_score: int, 
+                     game_tiles: list, won_before_move: bool, 
+                     move_count: int) -> dict:
+    """Return the record of a finished round, which is the format read by 
+    read_replay_records. The record has the seed of the round, round_seed, 
+    its moves as a string of keys from MOVES_WASD, its score, round_score, 
+    and its outcome. The outcome is game_outcome of the final game board, 
+    game_tiles, where won_before_move tells if the winning tile was on the
+    board before the last move. The record also has the largest tile and 
+    the number of moves made, move_count.
+
+    >>> get_round_record(7, ["w", "a"], 4, [[4, 2, 0, 0], 
+                                            [0, 0, 0, 0], 
+                                            [0, 0, 0, 0],
+                                            [0, 0, 0, 0]], False, 2)
+    {"seed": 7, "moves": "wa", "score": 4, "outcome": "in progress", 
+     "max_tile": 4, "move_count": 2}
+    """
+
+    return {"seed": round_seed,
+            "moves": "".join(moves),
+            "score": round_score,
+            "outcome": game_outcome(game_tiles, won_before_move),
+            "max_tile": get_max_tile(game_tiles),
+            "move_count": move_count}
+
+
+def reached_winning_tile(game_tiles: list, won: bool) -> bool:
+    """Return True if game_tiles contains the winning tile for the first time 
+    in a round, meaning the user has not won in a previous move. Otherwise, 
+    return False."""
+
+    return game_outcome(game_tiles, won) == "win"
+
+
+def few_empty_tiles(game_tiles: list, won: bool) -> bool:
+    """Return True if game_tiles has fewer than MINED_EMPTY_TILES empty tiles.
+    Otherwise, return False."""
+
+    empty_tiles = 0
+
+    for row in game_tiles:
+        empty_tiles += row.count(EMPTY_TILE)
+
+    return empty_tiles < MINED_EMPTY_TILES
+
+
+# Predicates used to mine positions from replays when none are given. Replay
+# predicates must be module level functions so they can be sent to worker 
+# processes.
+REPLAY_PREDICATES = {"winning tile": reached_winning_tile,
+                     "few empty tiles": few_empty_tiles}
+
+
+def save_replay_record(file_name: str, record: dict):
+    """Append the round record, record, to the file file_name as one line of
+    JSON, so it can be read back by read_replay_records."""
+
+    with open(file_name, "a") as replay_file:
+        replay_file.write(json.dumps(record) + "\n")
+
+
+def read_replay_records(file_name: str):
+    """Yield the recorded games in the file file_name one at a time. Each 
+    line of the file is a JSON object made by get_round_record, such as
+
+    {"seed": 7, "moves": "wasd", "score": 20, "outcome": "in progress"}
+
+    with the seed of the game, its moves as a string of keys, its final score
+    and its outcome. An optional "key_bind" object gives the keybind the 
+    moves were recorded with, if it is not MOVES_WASD. Lines that are not 
+    valid JSON are yielded as strings, so they are reported as failed 
+    replays instead of stopping the whole file."""
+
+    with open(file_name) as replay_file:
+        for line in replay_file:
+            # Skip blank lines between records.
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield line.strip()
+
+
+def chunk_replay_records(records, chunk_size: int):
+    """Yield the recorded games in records as lists of at most chunk_size 
+    records, so that only one chunk needs to be held in memory at a time.
+
+    >>> list(chunk_replay_records(["a", "b", "c"], 2))
+    [["a", "b"], ["c"]]
+    """
+
+    chunk = []
+
+    for record in records:
+        chunk.append(record)
+
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def replay_game(record: dict, predicates: dict) -> dict:
+    """Re-simulate the recorded game, record, from its seed and moves. Return
+    a dictionary with the replayed score and outcome, whether they diverge 
+    from the recorded score and outcome, and the positions matched by the 
+    functions in predicates as (name, move number, game tiles) tuples."""
+
+    key_bind_mode = record.get("key_bind", MOVES_WASD)
+
+    # The random tiles must be drawn in the same order as in game_round.
+    round_rng = Random(record["seed"])
+    game_tiles = generate_empty_board()
+
+    for i in range(STARTING_TILES):
+        game_tiles = add_random_tile(game_tiles, round_rng)
+
+    round_score = 0
+    won = False
+    positions = []
+    outcome = game_outcome(game_tiles, won)
+    mine_replay_position(game_tiles, won, 0, predicates, positions)
+
+    for move_number in range(1, len(record["moves"]) + 1):
+        move = record["moves"][move_number - 1]
+
+        # The user quit the round, so no later moves were played.
+        if move == key_bind_mode["quit"]:
+            break
+
+        move_direction = get_move_direction(move, key_bind_mode)
+        new_game_tiles, move_score = shift_game_board(game_tiles, 
+            move_direction)
+        round_score += move_score
+        won = won or check_tile(game_tiles, WINNING_TILE)
+
+        # game_round ends without adding a tile once MAX_TILE is created.
+        if check_tile(game_tiles, MAX_TILE):
+            outcome = game_outcome(game_tiles, won)
+            break
+
+        # Only moves that change the game board add a random tile.
+        if new_game_tiles != game_tiles:
+            game_tiles = add_random_tile(new_game_tiles, round_rng)
+
+        mine_replay_position(game_tiles, won, move_number, predicates, 
+                             positions)
+
+        # The outcome is checked with the won flag from before the move, so
+        # it matches the outcome saved by get_round_record.
+        outcome = game_outcome(game_tiles, won)
+
+    return {"seed": record["seed"],
+            "score": round_score,
+            "outcome": outcome,
+            "diverged": round_score != record["score"] or 
+                        outcome != record["outcome"],
+            "positions": positions,
+            "error": None}
+
+
+def mine_replay_position(game_tiles: list, won: bool, move_number: int, 
+                         predicates: dict, positions: list):
+    """Append a (name, move number, game tiles) tuple to positions for each
+    function in predicates that matches the position game_tiles, reached 
+    after move_number moves of a replay."""
+
+    for name in predicates:
+        if predicates[name](game_tiles, won):
+            positions.append((name, move_number, 
+                              [row[:] for row in game_tiles]))
+
+
+def replay_chunk(chunk: list, start: int, predicates: dict) -> tuple:
+    """Replay every recorded game in chunk, a list of records where the first
+    record is number start in its collection. Return a list of the replay
+    results, each with the number of its record under "index", and the 
+    profile of the replays made by collect_profile."""
+
+    results = []
+
+    for i in range(len(chunk)):
+        # A malformed record fails on its own instead of stopping the chunk.
+        try:
+            result = replay_game(chunk[i], predicates)
+        except (AttributeError, IndexError, KeyError, TypeError, 
+                ValueError) as error:
+            result = {"seed": None,
+                      "score": None,
+                      "outcome": None,
+                      "diverged": True,
+                      "positions": [],
+                      "error": "{}: {}".format(type(error).__name__, error)}
+
+        result["index"] = start + i
+        results.append(result)
+
+    return results, collect_profile()
+
+
+def verify_replays(records, predicates: dict = None, processes: int = None, 
+                   chunk_size: int = REPLAY_CHUNK_SIZE):
+    """Replay the recorded games in records across a pool of processes 
+    worker processes, and yield the result of each replay in the order of
+    records. Records are read and sent to the pool in chunks of chunk_size, 
+    with only a few chunks per process in flight at once, so memory use does
+    not grow with the number of records. Positions are mined with the 
+    functions in predicates, or REPLAY_PREDICATES if none are given. If 
+    profiling is enabled, the workers are profiled too and their timers, 
+    retries and trace are added to the ones in this process."""
+
+    if predicates is None:
+        predicates = REPLAY_PREDICATES
+
+    if processes is None:
+        processes = cpu_count() or 1
+
+    pending = deque()
+    start = 0
+
+    with Pool(processes, start_worker_profiling, 
+              (is_profiling(), _profile_trace is not None)) as pool:
+        for chunk in chunk_replay_records(records, chunk_size):
+            pending.append(pool.apply_async(replay_chunk, 
+                                            (chunk, start, predicates)))
+            start += len(chunk)
+
+            # Wait for the oldest chunk before reading any more records.
+            if len(pending) >= processes * REPLAY_CHUNKS_PER_PROCESS:
+                results, profile = pending.popleft().get()
+                merge_profile(profile)
+                yield from results
+
+        while pending:
+            results, profile = pending.popleft().get()
+            merge_profile(profile)
+            yield from results
+
+
+def verify_replay_file(file_name: str, processes: int = None) -> int:
+    """Replay every recorded game in the file file_name and print each replay
+    that diverges from its record, along with a count of the mined 
+    positions. Return the number of diverging replays."""
+
+    replays = 0
+    divergences = 0
+    mined_positions = {}
+
+    for result in verify_replays(read_replay_records(file_name), 
+                                 processes=processes):
+        replays += 1
+
+        if result["error"] is not None:
+            divergences += 1
+            print("Replay {} failed: {}".format(result["index"], 
+                  result["error"]))
+
+        elif result["diverged"]:
+            divergences += 1
+            print("Replay {} (seed {}) diverged: score {}, outcome {}."
+                  .format(result["index"], result["seed"], result["score"], 
+                  result["outcome"]))
+
+        for name, move_number, game_tiles in result["positions"]:
+            mined_positions[name] = mined_positions.get(name, 0) + 1
+
+    print("\n{} of {} replays diverged or failed.".format(divergences, 
+          replays))
+
+    for name in mined_positions:
+        print("{} : {} positions".format(name, mined_positions[name]))
+
+    return divergences
+
+
+def profile_function(name: str, function):
+    """Return a version of function that adds the number of calls and the time
+    spent in each call to the timer for name, and records each call in the
+    trace if tracing is enabled."""
+
+    timer = _profile_timers.setdefault(name, [0, 0.0])
+
+    def profiled_function(*args, **kwargs):
+        start = perf_counter()
+
+        try:
+            return function(*args, **kwargs)
+
+        finally:
+            elapsed = perf_counter() - start
+            timer[0] += 1
+            timer[1] += elapsed
+
+            if _profile_trace is not None:
+                # Times in the trace event format are in microseconds.
+                _profile_trace.append({"name": name,
+                                       "ph": "X",
+                                       "ts": start * 1000000,
+                                       "dur": elapsed * 1000000,
+                                       "pid": getpid(),
+                                       "tid": 0})
+
+    return profiled_function
+
+
+def enable_profiling(trace: bool = False):
+    """Start timing the functions in PROFILED_FUNCTIONS and counting the 
+    retries of add_random_tile. If trace is True, also record the last 
+    PROFILE_TRACE_LIMIT calls so the session can be saved with 
+    dump_profile_trace. If trace is False, any trace recorded so far is 
+    dropped. While profiling is disabled, none of this code runs."""
+
+    global _profile_trace, _tile_retries
+
+    _tile_retries = _profile_retries
+
+    if not trace:
+        _profile_trace = None
+    elif _profile_trace is None:
+        _profile_trace = deque(maxlen=PROFILE_TRACE_LIMIT)
+
+    for name in PROFILED_FUNCTIONS:
+        # The functions are already being profiled.
+        if name in _unprofiled_functions:
+            continue
+
+        if name in globals():
+            function = globals()[name]
+        else:
+            function = getattr(builtins, name)
+
+        # Functions in this module look up these names when they are called,
+        # so replacing them here profiles every call in the game.
+        _unprofiled_functions[name] = function
+        globals()[name] = profile_function(name, function)
+
+
+def disable_profiling():
+    """Stop profiling and restore the original functions. The timers, retries
+    and trace collected so far are kept until reset_profiling is called."""
+
+    global _tile_retries
+
+    for name in _unprofiled_functions:
+        # Built-in functions such as input are restored by removing the 
+        # module level name that hides them.
+        if hasattr(builtins, name) and \
+            _unprofiled_functions[name] is getattr(builtins, name):
+
+            del globals()[name]
+        else:
+            globals()[name] = _unprofiled_functions[name]
+
+    _unprofiled_functions.clear()
+    _tile_retries = None
+
+
+def reset_profiling():
+    """Disable profiling and discard the timers, retries and trace."""
+
+    global _profile_trace
+
+    disable_profiling()
+    _profile_timers.clear()
+    _profile_retries.clear()
+    _profile_trace = None
+
+
+def is_profiling() -> bool:
+    """Return True if profiling is enabled. Otherwise, return False."""
+
+    return len(_unprofiled_functions) > 0
+
+
+def start_worker_profiling(profiling: bool, trace: bool):
+    """Set up profiling in a new worker process. Profiling is enabled, with 
+    tracing if trace is True, only if profiling is True. Anything copied 
+    from the parent process is discarded first, so the worker only reports 
+    its own calls."""
+
+    reset_profiling()
+
+    if profiling:
+        enable_profiling(trace)
+
+
+def collect_profile():
+    """Return the timers, retries and trace events collected in this process
+    since the last call, as a dictionary that can be passed to 
+    merge_profile, and start counting again from zero. Return None if 
+    profiling is disabled."""
+
+    if not is_profiling():
+        return None
+
+    profile = {"timers": {},
+               "retries": dict(_profile_retries),
+               "trace": list(_profile_trace or [])}
+
+    # The profiled functions hold on to their timers, so they are set back
+    # to zero in place.
+    for name in _profile_timers:
+        profile["timers"][name] = _profile_timers[name][:]
+        _profile_timers[name][0] = 0
+        _profile_timers[name][1] = 0.0
+
+    _profile_retries.clear()
+    if _profile_trace is not None:
+        _profile_trace.clear()
+
+    return profile
+
+
+def merge_profile(profile: dict):
+    """Add the timers, retries and trace events in profile, made by 
+    collect_profile in a worker process, to the ones in this process. Trace
+    events are only kept if this process is tracing."""
+
+    if profile is None:
+        return
+
+    for name in profile["timers"]:
+        timer = _profile_timers.setdefault(name, [0, 0.0])
+        timer[0] += profile["timers"][name][0]
+        timer[1] += profile["timers"][name][1]
+
+    for retries in profile["retries"]:
+        _profile_retries[retries] = _profile_retries.get(retries, 0) + \
+            profile["retries"][retries]
+
+    if _profile_trace is not None:
+        _profile_trace.extend(profile["trace"])
+
+
+def print_profile_summary():
+    """Print the number of calls, total time and mean time per call of each
+    profiled function, and a histogram of the retries in add_random_tile."""
+
+    print("\n{:<16}{:>10}{:>14}{:>14}".format("Function", "Calls", 
+          "Total (s)", "Mean (us)"))
+    print("═" * 54)
+
+    for name in PROFILED_FUNCTIONS:
+        if name in _profile_timers:
+            calls, total = _profile_timers[name]
+            mean = total / calls * 1000000 if calls else 0
+
+            print("{:<16}{:>10}{:>14.4f}{:>14.1f}".format(name, calls, total, 
+                  mean))
+
+    if _profile_retries:
+        print("\nadd_random_tile retries")
+        print("═" * len("add_random_tile retries"))
+
+        for retries in sorted(_profile_retries):
+            print("{:>3} : {}".format(retries, _profile_retries[retries]))
+
+    if _profile_trace is not None and \
+        len(_profile_trace) == PROFILE_TRACE_LIMIT:
+
+        print("\nOnly the last {} calls were kept in the trace."
+              .format(PROFILE_TRACE_LIMIT))
+
+    print()
+
+
+def dump_profile_trace(file_name: str = PROFILE_TRACE_FILE):
+    """Save the calls recorded while tracing to the file file_name in the 
+    trace event format, which can be opened in chrome://tracing or 
+    Perfetto."""
+
+    with open(file_name, "w") as trace_file:
+        json.dump({"traceEvents": list(_profile_trace or [])}, trace_file)
+
+
+def open_score_store(file_name: str = SCORE_STORE_FILE) -> sqlite3.Connection:
+    """Open the score store in the file file_name, creating it if needed, and
+    return the connection to it. Finished rounds are only ever appended to 
+    the store. The store is kept in write-ahead log mode so that many game 
+    processes can write to it at once, and every round is synced to disk 
+    before record_round returns."""
+
+    # Transactions are started explicitly in record_round.
+    score_store = sqlite3.connect(file_name, timeout=SCORE_STORE_TIMEOUT, 
+                                  isolation_level=None)
+    score_store.execute("PRAGMA journal_mode = WAL")
+    score_store.execute("PRAGMA synchronous = FULL")
+
+    score_store.execute("""CREATE TABLE IF NOT EXISTS rounds (
+                               id INTEGER PRIMARY KEY,
+                               player TEXT NOT NULL,
+                               score INTEGER NOT NULL,
+                               max_tile INTEGER NOT NULL,
+                               moves INTEGER NOT NULL,
+                               key_bind TEXT NOT NULL,
+                               finished REAL NOT NULL)""")
+    score_store.execute("""CREATE INDEX IF NOT EXISTS rounds_by_score 
+                           ON rounds (score DESC)""")
+
+    # Summary tables kept up to date with every round, so the best score of a
+    # player and percentiles can be found without reading every round.
+    score_store.execute("""CREATE TABLE IF NOT EXISTS player_best (
+                               player TEXT PRIMARY KEY,
+                               score INTEGER NOT NULL) WITHOUT ROWID""")
+
+    # Node n of the score tree holds the number of rounds with scores from 
+    # n - (n & -n) to n - 1, like a Fenwick tree, so counting the rounds 
+    # below any score reads at most 27 nodes.
+    score_store.execute("""CREATE TABLE IF NOT EXISTS score_tree (
+                               node INTEGER PRIMARY KEY,
+                               rounds INTEGER NOT NULL)""")
+
+    return score_store
+
+
+def add_to_score_tree(score_store: sqlite3.Connection, score: int, 
+                      rounds: int):
+    """Add rounds rounds with the score score to the score tree of the score
+    store, score_store. Scores of SCORE_TREE_SIZE or more are counted as 
+    SCORE_TREE_SIZE - 1. This must be called inside a transaction."""
+
+    node = min(max(score, 0), SCORE_TREE_SIZE - 1) + 1
+    nodes = []
+
+    while node <= SCORE_TREE_SIZE:
+        nodes.append((node, rounds))
+        node += node & -node
+
+    score_store.executemany("""INSERT INTO score_tree (node, rounds) 
+                               VALUES (?, ?) 
+                               ON CONFLICT (node) DO UPDATE 
+                               SET rounds = rounds + excluded.rounds""", 
+                            nodes)
+
+
+def count_rounds_below(score_store: sqlite3.Connection, score: int) -> int:
+    """Return the number of rounds in the score store, score_store, with a 
+    lower score than score, using at most 27 nodes of the score tree."""
+
+    node = min(max(score, 0), SCORE_TREE_SIZE)
+    nodes = []
+
+    while node > 0:
+        nodes.append(node)
+        node -= node & -node
+
+    if not nodes:
+        return 0
+
+    return score_store.execute("""SELECT COALESCE(SUM(rounds), 0) 
+                                  FROM score_tree 
+                                  WHERE node IN ({})"""
+                               .format(", ".join("?" * len(nodes))), 
+                               nodes).fetchone()[0]
+
+
+def get_score_tree_node(score_store: sqlite3.Connection, node: int) -> int:
+    """Return the number of rounds held by node in the score tree of the 
+    score store, score_store."""
+
+    rounds = score_store.execute("""SELECT rounds FROM score_tree 
+                                    WHERE node = ?""", (node,)).fetchone()
+
+    if rounds is None:
+        return 0
+
+    return rounds[0]
+
+
+def record_round(score_store: sqlite3.Connection, player: str, score: int, 
+                 max_tile: int, moves: int, key_bind_mode: dict):
+    """Append one finished round by player to the score store, score_store, 
+    with its score, largest tile, number of moves, the keybind it was played
+    with and the current time."""
+
+    # Take the write lock before reading anything, so two processes cannot
+    # update the summary tables from the same old values.
+    score_store.execute("BEGIN IMMEDIATE")
+
+    try:
+        score_store.execute("""INSERT INTO rounds (player, score, max_tile, 
+                                   moves, key_bind, finished) 
+                               VALUES (?, ?, ?, ?, ?, ?)""", 
+                            (player, score, max_tile, moves, 
+                             json.dumps(key_bind_mode), time()))
+        score_store.execute("""INSERT INTO player_best (player, score) 
+                               VALUES (?, ?) 
+                               ON CONFLICT (player) DO UPDATE 
+                               SET score = MAX(score, excluded.score)""", 
+                            (player, score))
+        add_to_score_tree(score_store, score, 1)
+        score_store.execute("COMMIT")
+
+    except BaseException:
+        score_store.execute("ROLLBACK")
+        raise
+
+
+def get_top_rounds(score_store: sqlite3.Connection, 
+                   count: int = LEADERBOARD_SIZE) -> list:
+    """Return the count highest scoring rounds in the score store, 
+    score_store, as a list of (player, score, max tile, moves) tuples, from 
+    the highest score to the lowest."""
+
+    return score_store.execute("""SELECT player, score, max_tile, moves 
+                                  FROM rounds 
+                                  ORDER BY score DESC 
+                                  LIMIT ?""", (count,)).fetchall()
+
 
+def get_player_best(score_store: sqlite3.Connection, player: str) -> int:
+    """Return the highest score of player in the score store, score_store, or
+    0 if player has not finished a round."""
 
-def main():
-    """The main game loop, with rules and a game overview."""
+    best = score_store.execute("""SELECT score FROM player_best 
+                                  WHERE player = ?""", (player,)).fetchone()
+
+    if best is None:
+        return 0
+
+    return best[0]
+
+
+def get_score_percentile(score_store: sqlite3.Connection, score: int) -> float:
+    """Return the percentage of rounds in the score store, score_store, with 
+    a lower score than score. Return 0.0 if the store has no rounds."""
+
+    # The last node of the score tree holds every round.
+    total_rounds = get_score_tree_node(score_store, SCORE_TREE_SIZE)
+
+    if total_rounds == 0:
+        return 0.0
+
+    return count_rounds_below(score_store, score) / total_rounds * 100
+
+
+def get_percentile_score(score_store: sqlite3.Connection, 
+                         percentile: float) -> int:
+    """Return the lowest score in the score store, score_store, that is 
+    greater than or equal to the scores of percentile percent of the rounds.
+    Return 0 if the store has no rounds."""
+
+    total_rounds = get_score_tree_node(score_store, SCORE_TREE_SIZE)
+
+    if total_rounds == 0:
+        return 0
+
+    # Count at least one round, so a percentile of 0 gives the lowest score.
+    rounds_needed = max(1, ceil(total_rounds * percentile / 100))
+
+    # Walk down the score tree to the last node with fewer rounds at or 
+    # below it than rounds_needed. Its node number is the score after it.
+    node = 0
+    step = SCORE_TREE_SIZE // 2
+
+    while step > 0:
+        rounds = get_score_tree_node(score_store, node + step)
+
+        if rounds < rounds_needed:
+            node += step
+            rounds_needed -= rounds
+
+        step //= 2
+
+    return node
+
+
+def print_leaderboard(score_store: sqlite3.Connection):
+    """Print the highest scoring rounds in the score store, score_store."""
+
+    print("\nLeaderboard\n" + "═" * len("Leaderboard"))
+
+    top_rounds = get_top_rounds(score_store)
+    for place in range(len(top_rounds)):
+        player, score, max_tile, moves = top_rounds[place]
+        print("{}. {} : {} (tile {}, {} moves)".format(place + 1, player, 
+              score, max_tile, moves))
+
+    print()
+
+
+def get_player_name() -> str:
+    """Return the name of the user playing the game, which is their login 
+    name, or DEFAULT_PLAYER if it cannot be found."""
+
+    try:
+        return getuser()
+    except (KeyError, OSError):
+        return DEFAULT_PLAYER
+
+
+# Moved rows and their scores for packed boards, built by build_row_tables.
+# Entry r of each table is for the row packed as r.
+_left_rows = []
+_left_row_scores = []
+_right_rows = []
+_right_row_scores = []
+
+# The worker processes of the Monte Carlo player, kept between moves.
+_monte_carlo_pool = None
+_monte_carlo_processes = 0
+
+
+def slide_row(row: tuple) -> tuple:
+    """Slide and merge the tiles in row, a tuple of tiles, towards its start,
+    the same way move_left moves a row. Return the new row as a tuple and 
+    the score from the merges.
+
+    >>> slide_row((2, 2, 0, 2))
+    ((4, 2, 0, 0), 4)
+    """
+
+    tiles = [tile for tile in row if tile != EMPTY_TILE]
+    slid_row = []
+    score = 0
+    i = 0
+
+    while i < len(tiles):
+        # Merge two equal tiles, and skip the second one.
+        if i + 1 < len(tiles) and tiles[i] == tiles[i + 1]:
+            slid_row.append(tiles[i] * 2)
+            score += tiles[i] * 2
+            i += 2
+        else:
+            slid_row.append(tiles[i])
+            i += 1
+
+    slid_row += [EMPTY_TILE] * (len(row) - len(slid_row))
+
+    return tuple(slid_row), score
+
+
+def pack_row(row: tuple) -> int:
+    """Return the row of tiles, row, packed into 16 bits, with 4 bits for the 
+    exponent of each tile and the first tile in the lowest bits. Empty tiles
+    are 0, and tiles above 2 ** PACKED_MAX_EXPONENT are packed as that tile.
+
+    >>> pack_row((2, 0, 4, 32768))
+    0xf201
+    """
+
+    packed_row = 0
+
+    for col in range(len(row)):
+        exponent = min(row[col].bit_length() - 1, PACKED_MAX_EXPONENT)
+
+        if row[col] != EMPTY_TILE:
+            packed_row |= exponent << (4 * col)
+
+    return packed_row
+
+
+def unpack_row(packed_row: int) -> tuple:
+    """Return the row of tiles packed into packed_row by pack_row.
+
+    >>> unpack_row(0xf201)
+    (2, 0, 4, 32768)
+    """
+
+    row = []
+
+    for col in range(PACKED_BOARD_SIDE_LENGTH):
+        exponent = (packed_row >> (4 * col)) & 0xF
+
+        if exponent == 0:
+            row.append(EMPTY_TILE)
+        else:
+            row.append(TILE_BASE ** exponent)
+
+    return tuple(row)
+
+
+def build_row_tables():
+    """Fill in the tables of moved rows and scores for every one of the 
+    65536 packed rows, if they have not been built yet."""
+
+    if _left_rows:
+        return
+
+    for packed_row in range(PACKED_ROW_MASK + 1):
+        row = unpack_row(packed_row)
+
+        left_row, left_score = slide_row(row)
+        _left_rows.append(pack_row(left_row))
+        _left_row_scores.append(left_score)
+
+        # A move rightwards is a reflected move leftwards.
+        right_row, right_score = slide_row(row[::-1])
+        _right_rows.append(pack_row(right_row[::-1]))
+        _right_row_scores.append(right_score)
+
+
+def pack_board(game_tiles: list) -> int:
+    """Return the 4 by 4 game board, game_tiles, packed into a 64 bit 
+    integer, with each row packed by pack_row and the first row in the 
+    lowest bits. Raise ValueError if the game board is not 4 by 4."""
+
+    if BOARD_SIDE_LENGTH != PACKED_BOARD_SIDE_LENGTH:
+        raise ValueError("The Monte Carlo player only supports a 4 by 4 "
+                         + "game board.")
+
+    build_row_tables()
+    board = 0
+
+    for row in range(PACKED_BOARD_SIDE_LENGTH):
+        board |= pack_row(tuple(game_tiles[row])) << (16 * row)
+
+    return board
+
+
+def unpack_board(board: int) -> list:
+    """Return the game board packed into board by pack_board as a two 
+    dimensional list."""
+
+    game_tiles = []
+
+    for row in range(PACKED_BOARD_SIDE_LENGTH):
+        game_tiles.append(list(unpack_row((board >> (16 * row)) & 
+                                          PACKED_ROW_MASK)))
+
+    return game_tiles
+
+
+def transpose_board(board: int) -> int:
+    """Return the packed game board, board, with its rows and columns 
+    swapped."""
+
+    # Swap the 4 bit cells across the diagonal of each 2 by 2 block, then 
+    # swap the 2 by 2 blocks across the diagonal of the board.
+    board = (board & 0xF0F00F0FF0F00F0F) | \
+        ((board & 0x0000F0F00000F0F0) << 12) | \
+        ((board & 0x0F0F00000F0F0000) >> 12)
+
+    return (board & 0xFF00FF0000FF00FF) | \
+        ((board & 0x00FF00FF00000000) >> 24) | \
+        ((board & 0x00000000FF00FF00) << 24)
+
+
+def fast_board_move(board: int, move_direction: str) -> tuple:
+    """Perform one move of board, a game board packed by pack_board, in the
+    direction named by move_direction. Return the new packed board and the 
+    score from the move. The board is the same as board if no tiles moved. 
+    This gives the same moves as shift_game_board, using one table lookup 
+    for each row instead of copying the board for each shift, merge and 
+    reflection.
+
+    >>> fast_board_move(pack_board([[0, 0, 0, 2], 
+                                    [0, 2, 0, 0], 
+                                    [0, 4, 0, 0], 
+                                    [2, 0, 0, 0]]), "up")
+    (pack_board([[2, 2, 0, 2], 
+                 [0, 4, 0, 0], 
+                 [0, 0, 0, 0], 
+                 [0, 0, 0, 0]]), 0)
+    """
+
+    # Columns are moved as the rows of the transposed board.
+    if move_direction == "up" or move_direction == "down":
+        board = transpose_board(board)
+
+    if move_direction == "left" or move_direction == "up":
+        rows = _left_rows
+        row_scores = _left_row_scores
+    else:
+        rows = _right_rows
+        row_scores = _right_row_scores
+
+    row_0 = board & PACKED_ROW_MASK
+    row_1 = (board >> 16) & PACKED_ROW_MASK
+    row_2 = (board >> 32) & PACKED_ROW_MASK
+    row_3 = board >> 48
+
+    moved_board = rows[row_0] | (rows[row_1] << 16) | \
+        (rows[row_2] << 32) | (rows[row_3] << 48)
+    score = row_scores[row_0] + row_scores[row_1] + row_scores[row_2] + \
+        row_scores[row_3]
+
+    if move_direction == "up" or move_direction == "down":
+        moved_board = transpose_board(moved_board)
+
+    return moved_board, score
+
+
+def add_fast_random_tile(board: int, rng: Random) -> int:
+    """Return the packed game board, board, with a 2 or 4 tile added at a 
+    random empty tile using the random number generator rng. The chance of a
+    4 tile is the same as in add_random_tile, but the empty tile is picked 
+    directly instead of by retrying. The board must have an empty tile."""
+
+    # Set the lowest bit of every cell that holds a tile, then flip them to
+    # mark the empty cells.
+    occupied = board | (board >> 1)
+    occupied = (occupied | (occupied >> 2)) & PACKED_CELL_LOW_BITS
+    empty_cells = occupied ^ PACKED_CELL_LOW_BITS
+
+    # Drop a random number of the lowest empty cells and use the next one.
+    for i in range(int(rng.random() * bin(empty_cells).count("1"))):
+        empty_cells &= empty_cells - 1
+
+    if rng.random() > TILE_CHANCE_4:
+        exponent = 2
+    else:
+        exponent = 1
+
+    return board | ((empty_cells & -empty_cells) * exponent)
+
+
+def random_playout(board: int, depth_cap: int, rng: Random) -> int:
+    """Play random moves from board, a game board packed by pack_board, until
+    no move is possible or depth_cap moves have been played. Return the 
+    score earned during the playout. Packed tiles stop growing at 
+    2 ** PACKED_MAX_EXPONENT, so playouts do not look for MAX_TILE."""
+
+    score = 0
+
+    for depth in range(depth_cap):
+        moved = False
+
+        # Play the first direction in a random order that moves any tiles.
+        for move_direction in MOVE_ORDERS[int(rng.random() * 
+                                              len(MOVE_ORDERS))]:
+            moved_board, move_score = fast_board_move(board, move_direction)
+
+            if moved_board != board:
+                moved = True
+                break
+
+        # The playout is a loss.
+        if not moved:
+            break
+
+        score += move_score
+        board = add_fast_random_tile(moved_board, rng)
+
+    return score
+
+
+def monte_carlo_playouts(board: int, playouts: int, depth_cap: int, 
+                         time_limit: float, playout_seed: int) -> tuple:
+    """Run up to playouts random playouts from board, a game board packed by
+    pack_board, stopping early once time_limit seconds have passed. At 
+    least one playout is always run. Return the total score of the playouts
+    and the number of playouts run."""
+
+    build_row_tables()
+
+    deadline = perf_counter() + time_limit
+    rng = Random(playout_seed)
+    total_score = 0
+    playouts_run = 0
+
+    while playouts_run < playouts and (playouts_run == 0 or 
+                                       perf_counter() < deadline):
+        total_score += random_playout(board, depth_cap, rng)
+        playouts_run += 1
+
+    return total_score, playouts_run
+
+
+def get_monte_carlo_pool(processes: int) -> Pool:
+    """Return a pool of processes worker processes for playouts, starting a
+    new pool only if there is none with that many processes."""
+
+    global _monte_carlo_pool, _monte_carlo_processes
+
+    if _monte_carlo_pool is None or _monte_carlo_processes != processes:
+        close_monte_carlo_pool()
+
+        # Build the tables first, so forked workers do not each build them.
+        build_row_tables()
+        _monte_carlo_pool = Pool(processes)
+        _monte_carlo_processes = processes
+
+    return _monte_carlo_pool
+
+
+def close_monte_carlo_pool():
+    """Stop the worker processes started by get_monte_carlo_pool."""
+
+    global _monte_carlo_pool, _monte_carlo_processes
+
+    if _monte_carlo_pool is not None:
+        _monte_carlo_pool.terminate()
+        _monte_carlo_pool.join()
+        _monte_carlo_pool = None
+        _monte_carlo_processes = 0
+
+
+def choose_monte_carlo_move(game_tiles: list, processes: int = 1,
+                            playouts: int = MONTE_CARLO_PLAYOUTS,
+                            depth_cap: int = MONTE_CARLO_DEPTH_CAP,
+                            time_budget: float = MONTE_CARLO_TIME_BUDGET
+                            ) -> tuple:
+    """Return the direction ("up", "down", "left" or "right") with the best 
+    average score over random playouts from the board after moving 
+    game_tiles in that direction, a dictionary of the number of playouts run
+    for each legal direction, and the number of playouts run per second.
+
+    At most playouts playouts are run. They are shared between the legal 
+    moves, and split into one batch per process for a pool of processes 
+    worker processes, or run in this process if processes is 1. Each legal 
+    move gets an equal share of time_budget seconds, and playouts stop after
+    depth_cap moves. Return None as the direction if no move is possible."""
+
+    start = perf_counter()
+    board = pack_board(game_tiles)
+
+    legal_moves = {}
+    for move_direction in MOVE_DIRECTIONS:
+        moved_board, move_score = fast_board_move(board, move_direction)
+
+        if moved_board != board:
+            legal_moves[move_direction] = (moved_board, move_score)
+
+    if not legal_moves:
+        return None, {}, 0.0
+
+    legal_directions = list(legal_moves)
+    task_count = len(legal_directions) * processes
+
+    # Batches of a pool run side by side, so each one may use the whole share
+    # of time of its move.
+    time_limit = time_budget / len(legal_directions)
+
+    # Tasks alternate between the moves, so every move is started as soon as
+    # a worker process is free. The playouts are split as evenly as 
+    # possible, and tasks left with no playouts are not run.
+    tasks = []
+    task_directions = []
+    for task in range(task_count):
+        task_playouts = playouts // task_count
+        if task < playouts % task_count:
+            task_playouts += 1
+
+        if task_playouts > 0:
+            move_direction = legal_directions[task % len(legal_directions)]
+            tasks.append((legal_moves[move_direction][0], task_playouts, 
+                          depth_cap, time_limit, randint(0, 2 ** 32)))
+            task_directions.append(move_direction)
+
+    if processes > 1:
+        batch_results = get_monte_carlo_pool(processes).starmap(
+            monte_carlo_playouts, tasks)
+    else:
+        batch_results = [monte_carlo_playouts(*task) for task in tasks]
+
+    total_scores = {}
+    move_playouts = {}
+    for move_direction in legal_directions:
+        total_scores[move_direction] = 0
+        move_playouts[move_direction] = 0
+
+    for task in range(len(tasks)):
+        total, runs = batch_results[task]
+        total_scores[task_directions[task]] += total
+        move_playouts[task_directions[task]] += runs
+
+    playouts_run = sum(move_playouts.values())
+    best_direction = None
+    best_score = -1
+
+    for move_direction in legal_directions:
+        average_score = legal_moves[move_direction][1]
+
+        if move_playouts[move_direction] > 0:
+            average_score += total_scores[move_direction] / \
+                move_playouts[move_direction]
+
+        # A move without playouts is only compared with the others if no 
+        # move has any.
+        elif playouts_run > 0:
+            continue
+
+        if average_score > best_score:
+            best_direction = move_direction
+            best_score = average_score
+
+    playout_rate = playouts_run / (perf_counter() - start)
+
+    return best_direction, move_playouts, playout_rate
+
+
+def monte_carlo_round(processes: int = None, 
+                      playouts: int = MONTE_CARLO_PLAYOUTS,
+                      depth_cap: int = MONTE_CARLO_DEPTH_CAP,
+                      time_budget: float = MONTE_CARLO_TIME_BUDGET) -> tuple:
+    """Play one round of 2048 with every move chosen by 
+    choose_monte_carlo_move, using processes worker processes, and print the
+    board and the playouts per second after each move. The round goes on 
+    after the winning tile is created. Return the score from the round, the
+    largest tile on the game board and the number of moves made."""
+
+    if processes is None:
+        processes = cpu_count() or 1
+
+    round_score = 0
+    move_count = 0
+
+    game_tiles = generate_empty_board()
+
+    for i in range(STARTING_TILES):
+        game_tiles = add_random_tile(game_tiles)
+
+    print_board(game_tiles)
+
+    try:
+        # The player keeps going after a win, as if it had already won.
+        while game_outcome(game_tiles, True) != "loss" and \
+            not check_tile(game_tiles, MAX_TILE):
+
+            move_direction, move_playouts, playout_rate = \
+                choose_monte_carlo_move(game_tiles, processes, playouts, 
+                                        depth_cap, time_budget)
+
+            game_tiles, move_score = shift_game_board(game_tiles, 
+                                                      move_direction)
+            game_tiles = add_random_tile(game_tiles)
+            round_score += move_score
+            move_count += 1
+
+            print("\nMove {}: {} ({:.0f} playouts per second)".format(
+                  move_count, move_direction, playout_rate))
+            print_board(game_tiles)
+
+    finally:
+        close_monte_carlo_pool()
+
+    print("Total Score: {}\n".format(round_score))
+
+    return round_score, get_max_tile(game_tiles), move_count
+
+
+def main(replay_file: str = REPLAY_FILE, 
+         score_store_file: str = SCORE_STORE_FILE):
+    """The main game loop, with rules and a game overview. Every finished 
+    round is saved to the file replay_file so it can be replayed, and to the
+    score store in the file score_store_file."""
 
     print("Welcome to...\n")
 
@@ -693,7 +1983,19 @@ def main():
     print("5. You lose when there are no more empty tiles and no more"
           + "\npossible moves.\n") 
 
-    high_score = 0
+    # Scores are kept in the score store between runs of the program. If it 
+    # cannot be opened, the high score is only kept until the program ends.
+    player = get_player_name()
+
+    try:
+        score_store = open_score_store(score_store_file)
+        high_score = get_player_best(score_store, player)
+    except sqlite3.Error as error:
+        print("Could not open the score store, so scores will not be saved: "
+              + "{}\n".format(error))
+        score_store = None
+        high_score = 0
+
     choice = PLAY
     key_bind_mode = MOVES_WASD
 
@@ -704,9 +2006,28 @@ def main():
             # Run a single round of 2048. 
             print("\nGame starting...\n")
             sleep(TIME_DELAY)
-            round_score = game_round(key_bind_mode)
+            round_record = game_round(key_bind_mode)
+            round_score = round_record["score"]
+
+            try:
+                save_replay_record(replay_file, round_record)
+            except OSError as error:
+                print("Could not save the replay of the round: {}"
+                      .format(error))
 
-            print("Total Score: {}\n".format(round_score))
+            print("Total Score: {}".format(round_score))
+
+            if score_store is not None:
+                try:
+                    record_round(score_store, player, round_score, 
+                                 round_record["max_tile"], 
+                                 round_record["move_count"], key_bind_mode)
+                    print("Better than {:.1f}% of rounds played.".format(
+                          get_score_percentile(score_store, round_score)))
+                except sqlite3.Error as error:
+                    print("Could not save the score: {}".format(error))
+
+            print()
 
             if round_score > high_score: 
                 high_score = round_score
@@ -715,8 +2036,14 @@ def main():
             if high_score != 0:
                 print("\nYour highest score was {}.".format(high_score))
 
+                if score_store is not None:
+                    print_leaderboard(score_store)
+
             print("\nThanks for playing 2048. Goodbye!")
 
+            if score_store is not None:
+                score_store.close()
+
         elif choice == SETTINGS: 
             key_bind_mode = choose_key_bind(key_bind_mode)
 
@@ -724,5 +2051,76 @@ def main():
             print("Invalid menu choice. Please try again.")
 
 
+def parse_arguments(argv: list = None):
+    """Return the command line options in argv, or in sys.argv if argv is 
+    None."""
+
+    parser = ArgumentParser(description="Play 2048 in the terminal.")
+    parser.add_argument("--replay-file", default=REPLAY_FILE,
+                        help="file that finished rounds are saved to")
+    parser.add_argument("--score-store", default=SCORE_STORE_FILE,
+                        help="file that the scores of all rounds are kept in")
+    parser.add_argument("--verify-replays", metavar="FILE",
+                        help="replay the recorded games in FILE and report "
+                        + "any that diverge, instead of playing")
+    parser.add_argument("--monte-carlo", action="store_true",
+                        help="watch the Monte Carlo player play a round, "
+                        + "instead of playing")
+    parser.add_argument("--playouts", type=int, default=MONTE_CARLO_PLAYOUTS,
+                        help="playouts for each move of the Monte Carlo "
+                        + "player")
+    parser.add_argument("--depth-cap", type=int, 
+                        default=MONTE_CARLO_DEPTH_CAP,
+                        help="most moves in one playout")
+    parser.add_argument("--time-budget", type=float, 
+                        default=MONTE_CARLO_TIME_BUDGET,
+                        help="seconds the Monte Carlo player may spend on "
+                        + "each move")
+    parser.add_argument("--processes", type=int,
+                        help="number of worker processes for replays and "
+                        + "playouts")
+
+    return parser.parse_args(argv)
+
+
+def run_program(arguments) -> int:
+    """Run the game, or the tool chosen by the command line options, 
+    arguments. Return the exit status of the program, which is 1 if any 
+    replays diverged or the replays could not be read, and 0 otherwise."""
+
+    if arguments.verify_replays:
+        try:
+            divergences = verify_replay_file(arguments.verify_replays, 
+                                             arguments.processes)
+        except OSError as error:
+            print("Could not read the replays: {}".format(error))
+            return 1
+
+        if divergences:
+            return 1
+    elif arguments.monte_carlo:
+        monte_carlo_round(arguments.processes, arguments.playouts, 
+                          arguments.depth_cap, arguments.time_budget)
+    else:
+        main(arguments.replay_file, arguments.score_store)
+
+    return 0
+
+
 if __name__ == "__main__":
-    main()
+    arguments = parse_arguments()
+
+    # Profile the session when the environment variable is set.
+    if environ.get(PROFILE_ENVIRONMENT_VARIABLE):
+        enable_profiling(True)
+
+        try:
+            exit_status = run_program(arguments)
+        finally:
+            disable_profiling()
+            print_profile_summary()
+            dump_profile_trace()
+    else:
+        exit_status = run_program(arguments)
+
+    sys.exit(exit_status)
@@ -0,0 +1,173 @@
+"""Tests for the fast board moves and the Monte Carlo player of 2048."""
+
+
+from multiprocessing import Pool
+from random import Random
+
+import pytest
+
+import Zhou_Allan_2048 as game
+
+
+# A board where every direction moves some tiles.
+OPEN_BOARD = [[2, 0, 0, 4],
+              [0, 8, 0, 0],
+              [0, 0, 2, 0],
+              [4, 0, 0, 2]]
+
+
+def random_game_tiles(rng: Random) -> list:
+    """Return a random 4 by 4 game board with tiles no larger than the 
+    largest packed tile."""
+
+    return [[rng.choice([0, 0, 2, 2, 4, 8, 16, 2048, 16384])
+             for col in range(game.BOARD_SIDE_LENGTH)]
+            for row in range(game.BOARD_SIDE_LENGTH)]
+
+
+def test_pack_board_round_trip():
+    rng = Random(2)
+
+    for i in range(1000):
+        game_tiles = random_game_tiles(rng)
+        board = game.pack_board(game_tiles)
+
+        assert game.unpack_board(board) == game_tiles
+        assert game.unpack_board(game.transpose_board(board)) == \
+            [list(column) for column in zip(*game_tiles)]
+
+
+def test_fast_board_move_matches_shift_game_board():
+    rng = Random(0)
+
+    for i in range(5000):
+        game_tiles = random_game_tiles(rng)
+        board = game.pack_board(game_tiles)
+
+        for move_direction in game.MOVE_DIRECTIONS:
+            moved_tiles, score = game.shift_game_board(game_tiles,
+                                                       move_direction)
+            moved_board, fast_score = game.fast_board_move(board,
+                                                           move_direction)
+
+            assert game.unpack_board(moved_board) == moved_tiles
+            assert fast_score == score
+
+
+def test_slide_row():
+    assert game.slide_row((2, 2, 2, 2)) == ((4, 4, 0, 0), 8)
+    assert game.slide_row((0, 4, 4, 8)) == ((8, 8, 0, 0), 8)
+    assert game.slide_row((2, 4, 8, 16)) == ((2, 4, 8, 16), 0)
+
+
+def test_packed_tiles_stop_growing():
+    board = game.pack_board([[32768, 32768, 0, 0],
+                             [0, 0, 0, 0],
+                             [0, 0, 0, 0],
+                             [0, 0, 0, 0]])
+
+    moved_board, score = game.fast_board_move(board, "left")
+
+    assert game.unpack_board(moved_board)[0] == [32768, 0, 0, 0]
+    assert score == 65536
+
+
+def test_add_fast_random_tile_fills_an_empty_tile():
+    board = game.pack_board([[2, 4, 8, 16],
+                             [32, 64, 0, 128],
+                             [2, 4, 8, 16],
+                             [32, 64, 128, 256]])
+
+    new_tiles = game.unpack_board(game.add_fast_random_tile(board,
+                                                            Random(1)))
+
+    assert new_tiles[1][2] in (2, 4)
+
+
+def test_add_fast_random_tile_uses_every_empty_tile():
+    board = game.pack_board(OPEN_BOARD)
+    rng = Random(3)
+    filled = set()
+
+    for i in range(2000):
+        new_tiles = game.unpack_board(game.add_fast_random_tile(board, rng))
+        for row in range(game.BOARD_SIDE_LENGTH):
+            for col in range(game.BOARD_SIDE_LENGTH):
+                if new_tiles[row][col] != OPEN_BOARD[row][col]:
+                    assert OPEN_BOARD[row][col] == 0
+                    filled.add((row, col))
+
+    assert len(filled) == sum(row.count(0) for row in OPEN_BOARD)
+
+
+def test_no_legal_move():
+    game_tiles = [[2, 4, 2, 4],
+                  [4, 2, 4, 2],
+                  [2, 4, 2, 4],
+                  [4, 2, 4, 2]]
+
+    assert game.choose_monte_carlo_move(game_tiles) == (None, {}, 0.0)
+
+
+def test_every_direction_gets_playouts_in_this_process():
+    move_direction, move_playouts, playout_rate = \
+        game.choose_monte_carlo_move(OPEN_BOARD, 1, 100000, 200, 0.05)
+
+    assert set(move_playouts) == set(game.MOVE_DIRECTIONS)
+    assert min(move_playouts.values()) > 0
+    assert move_direction in game.MOVE_DIRECTIONS
+    assert playout_rate > 0
+
+
+def test_every_direction_gets_playouts_in_a_pool():
+    try:
+        move_direction, move_playouts, playout_rate = \
+            game.choose_monte_carlo_move(OPEN_BOARD, 2, 100000, 200, 0.05)
+    finally:
+        game.close_monte_carlo_pool()
+
+    assert set(move_playouts) == set(game.MOVE_DIRECTIONS)
+    assert min(move_playouts.values()) > 0
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+@pytest.mark.parametrize("playouts", [1, 3, 10, 401])
+def test_playouts_are_capped(processes, playouts):
+    try:
+        move_direction, move_playouts, playout_rate = \
+            game.choose_monte_carlo_move(OPEN_BOARD, processes, playouts,
+                                         20, 10.0)
+    finally:
+        game.close_monte_carlo_pool()
+
+    assert sum(move_playouts.values()) == playouts
+    assert move_playouts[move_direction] > 0
+
+
+def test_time_is_shared_between_directions():
+    move_direction, move_playouts, playout_rate = \
+        game.choose_monte_carlo_move(OPEN_BOARD, 1, 100000, 50, 0.2)
+
+    # No direction should get more than a few times another's playouts.
+    assert max(move_playouts.values()) < 4 * min(move_playouts.values())
+
+
+def test_monte_carlo_round(capsys):
+    round_score, max_tile, move_count = game.monte_carlo_round(1, 20, 10,
+                                                               0.01)
+
+    assert move_count > 0
+    assert max_tile >= 2
+    assert "playouts per second" in capsys.readouterr().out
+
+
+def test_monte_carlo_command_line_option(monkeypatch):
+    calls = []
+    monkeypatch.setattr(game, "monte_carlo_round",
+                        lambda *arguments: calls.append(arguments))
+
+    game.run_program(game.parse_arguments(["--monte-carlo", "--playouts",
+                                           "50", "--processes", "2"]))
+
+    assert calls == [(2, 50, game.MONTE_CARLO_DEPTH_CAP,
+                      game.MONTE_CARLO_TIME_BUDGET)]
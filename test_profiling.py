@@ -0,0 +1,101 @@
+"""Tests for profiling the hot path of 2048."""
+
+
+import builtins
+import json
+import time
+
+import pytest
+
+import Zhou_Allan_2048 as game
+from test_replay import play_scripted_round
+
+
+@pytest.fixture(autouse=True)
+def clean_profiling():
+    """Make sure every test starts and ends with profiling reset."""
+
+    game.reset_profiling()
+    yield
+    game.reset_profiling()
+
+
+def test_disable_restores_input_and_sleep():
+    game.enable_profiling(True)
+
+    assert game.input is not builtins.input
+    assert game.sleep is not time.sleep
+    assert game.is_profiling()
+
+    game.disable_profiling()
+
+    assert "input" not in vars(game)
+    assert game.sleep is time.sleep
+    assert game.add_random_tile.__name__ == "add_random_tile"
+    assert not game.is_profiling()
+
+
+def test_enable_twice_wraps_once():
+    game.enable_profiling()
+    profiled_move = game.game_board_move
+    game.enable_profiling()
+
+    assert game.game_board_move is profiled_move
+
+
+def test_round_is_profiled(monkeypatch, capsys):
+    game.enable_profiling(True)
+    record = play_scripted_round(monkeypatch, 2, game.MOVES_WASD, 40)
+    game.disable_profiling()
+
+    timers = game._profile_timers
+    assert timers["game_board_move"][0] == len(record["moves"])
+    assert timers["print_board"][0] > 0
+    assert timers["game_outcome"][0] > 0
+    assert sum(game._profile_retries.values()) == \
+        timers["add_random_tile"][0]
+    assert len(game._profile_trace) > 0
+
+
+def test_replay_workers_are_profiled(monkeypatch, capsys, tmp_path):
+    records = [play_scripted_round(monkeypatch, move_seed, game.MOVES_WASD,
+                                   30)
+               for move_seed in range(6)]
+    monkeypatch.undo()
+    game.reset_profiling()
+
+    game.enable_profiling(True)
+    results = list(game.verify_replays(iter(records), processes=2,
+                                       chunk_size=2))
+    game.disable_profiling()
+
+    assert not any(result["diverged"] for result in results)
+    assert game._profile_timers["add_random_tile"][0] > 0
+    assert game._profile_timers["game_outcome"][0] > 0
+    assert sum(game._profile_retries.values()) == \
+        game._profile_timers["add_random_tile"][0]
+
+    trace_file = tmp_path / "trace.json"
+    game.dump_profile_trace(str(trace_file))
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    assert {event["name"] for event in events} >= {"add_random_tile",
+                                                   "game_outcome"}
+
+
+def test_trace_is_bounded(monkeypatch):
+    monkeypatch.setattr(game, "PROFILE_TRACE_LIMIT", 5)
+    game.enable_profiling(True)
+
+    for i in range(20):
+        game.game_outcome(game.generate_empty_board(), False)
+
+    assert len(game._profile_trace) == 5
+
+
+def test_enable_without_trace_stops_tracing():
+    game.enable_profiling(True)
+    game.game_outcome(game.generate_empty_board(), False)
+    game.enable_profiling(False)
+
+    assert game._profile_trace is None
+    assert game._profile_timers["game_outcome"][0] == 1
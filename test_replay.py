@@ -0,0 +1,153 @@
+"""Tests for recording rounds of 2048 and verifying their replays."""
+
+
+import random
+from random import Random
+
+import pytest
+
+import Zhou_Allan_2048 as game
+
+
+def play_scripted_round(monkeypatch, move_seed: int, key_bind_mode: dict,
+                        move_limit: int = 300) -> dict:
+    """Play one round of game_round with random moves chosen from move_seed,
+    quitting after move_limit moves. Return the round record."""
+
+    move_rng = Random(move_seed)
+    move_keys = [key_bind_mode[direction]
+                 for direction in game.MOVE_DIRECTIONS]
+    moves_made = [0]
+
+    def scripted_input(prompt: str = "") -> str:
+        if prompt.startswith("Your choice"):
+            return game.PLAY
+        if prompt.startswith("Are you sure"):
+            return "y"
+
+        moves_made[0] += 1
+        if moves_made[0] > move_limit:
+            return key_bind_mode["quit"]
+
+        return move_rng.choice(move_keys)
+
+    monkeypatch.setattr(game, "input", scripted_input, raising=False)
+    monkeypatch.setattr(game, "sleep", lambda seconds: None)
+
+    return game.game_round(key_bind_mode)
+
+
+@pytest.mark.parametrize("move_seed", range(5))
+def test_replay_matches_scripted_round(monkeypatch, capsys, move_seed):
+    record = play_scripted_round(monkeypatch, move_seed, game.MOVES_WASD)
+    result = game.replay_game(record, {})
+
+    assert not result["diverged"]
+    assert result["score"] == record["score"]
+    assert result["outcome"] == record["outcome"]
+
+
+def test_replay_of_custom_key_bind_round(monkeypatch, capsys):
+    record = play_scripted_round(monkeypatch, 11, game.MOVES_ESDF)
+
+    # Moves are saved with the default keybind.
+    assert set(record["moves"]) <= set("wasd")
+    assert not game.replay_game(record, {})["diverged"]
+
+
+def test_replay_detects_changed_score(monkeypatch, capsys):
+    record = play_scripted_round(monkeypatch, 3, game.MOVES_WASD)
+    record["score"] += 2
+
+    assert game.replay_game(record, {})["diverged"]
+
+
+def test_mined_positions_match_predicates(monkeypatch, capsys):
+    record = play_scripted_round(monkeypatch, 4, game.MOVES_WASD, 1000)
+    result = game.replay_game(record, game.REPLAY_PREDICATES)
+
+    assert result["positions"]
+    for name, move_number, game_tiles in result["positions"]:
+        assert name == "few empty tiles"
+        assert game.few_empty_tiles(game_tiles, False)
+
+
+def test_chunk_replay_records():
+    chunks = list(game.chunk_replay_records(iter(range(5)), 2))
+
+    assert chunks == [[0, 1], [2, 3], [4]]
+
+
+def test_verify_replays_reports_malformed_records(monkeypatch, capsys):
+    good_records = [play_scripted_round(monkeypatch, move_seed,
+                                        game.MOVES_WASD, 50)
+                    for move_seed in range(6)]
+    records = good_records[:3] + ["not json", {"seed": 1}] + good_records[3:]
+
+    results = list(game.verify_replays(iter(records), processes=2,
+                                       chunk_size=2))
+
+    assert [result["index"] for result in results] == list(range(8))
+    for i in [0, 1, 2, 5, 6, 7]:
+        assert results[i]["error"] is None
+        assert not results[i]["diverged"]
+    for i in [3, 4]:
+        assert results[i]["error"] is not None
+        assert results[i]["diverged"]
+
+
+def test_replay_file_round_trip(monkeypatch, capsys, tmp_path):
+    replay_file = str(tmp_path / "replays.jsonl")
+    record = play_scripted_round(monkeypatch, 8, game.MOVES_WASD, 100)
+
+    game.save_replay_record(replay_file, record)
+    with open(replay_file, "a") as file:
+        file.write("{broken\n")
+
+    records = list(game.read_replay_records(replay_file))
+    assert records == [record, "{broken"]
+    assert game.verify_replay_file(replay_file, processes=1) == 1
+
+
+def test_rounds_and_replays_leave_the_random_module_alone(monkeypatch,
+                                                         capsys):
+    state = random.getstate()
+    record = play_scripted_round(monkeypatch, 9, game.MOVES_WASD, 50)
+    state_after_round = random.getstate()
+
+    # The round only draws its seed from the random module.
+    random.setstate(state)
+    random.randint(0, game.REPLAY_SEED_LIMIT)
+    assert random.getstate() == state_after_round
+
+    game.replay_game(record, game.REPLAY_PREDICATES)
+    assert random.getstate() == state_after_round
+
+
+def write_replay_file(monkeypatch, file_name: str, score_change: int):
+    """Save one scripted round to file_name, with score_change added to its
+    recorded score."""
+
+    record = play_scripted_round(monkeypatch, 10, game.MOVES_WASD, 50)
+    record["score"] += score_change
+    game.save_replay_record(file_name, record)
+
+
+@pytest.mark.parametrize("score_change, exit_status", [(0, 0), (4, 1)])
+def test_verify_replays_exit_status(monkeypatch, capsys, tmp_path,
+                                    score_change, exit_status):
+    replay_file = str(tmp_path / "replays.jsonl")
+    write_replay_file(monkeypatch, replay_file, score_change)
+
+    arguments = game.parse_arguments(["--verify-replays", replay_file,
+                                      "--processes", "1"])
+
+    assert game.run_program(arguments) == exit_status
+
+
+def test_verify_missing_replay_file(capsys, tmp_path):
+    arguments = game.parse_arguments(["--verify-replays",
+                                      str(tmp_path / "missing.jsonl")])
+
+    assert game.run_program(arguments) == 1
+    assert "Could not read the replays" in capsys.readouterr().out
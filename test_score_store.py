@@ -0,0 +1,170 @@
+"""Tests for the persistent score store and leaderboard of 2048."""
+
+
+from multiprocessing import Pool
+from random import Random
+import sqlite3
+
+import pytest
+
+import Zhou_Allan_2048 as game
+from test_replay import play_scripted_round
+
+
+WRITERS = 4
+ROUNDS_PER_WRITER = 50
+
+
+def write_rounds(file_name: str, writer: int) -> list:
+    """Record ROUNDS_PER_WRITER rounds with random scores in the score store
+    in file_name. Return the (player, score) pairs that were recorded."""
+
+    rng = Random(writer)
+    score_store = game.open_score_store(file_name)
+    recorded = []
+
+    for i in range(ROUNDS_PER_WRITER):
+        player = "player {}".format(rng.randrange(5))
+        score = rng.randrange(0, 20000, 4)
+        game.record_round(score_store, player, score, 256, i,
+                          game.MOVES_WASD)
+        recorded.append((player, score))
+
+    score_store.close()
+
+    return recorded
+
+
+@pytest.fixture
+def filled_store(tmp_path):
+    """Return a score store filled by concurrent writers, and every
+    (player, score) pair written to it."""
+
+    file_name = str(tmp_path / "scores.db")
+
+    with Pool(WRITERS) as pool:
+        written = pool.starmap(write_rounds,
+                               [(file_name, writer)
+                                for writer in range(WRITERS)])
+
+    score_store = game.open_score_store(file_name)
+    yield score_store, [pair for pairs in written for pair in pairs]
+    score_store.close()
+
+
+def test_concurrent_writers_keep_every_round(filled_store):
+    score_store, recorded = filled_store
+
+    rounds = score_store.execute("SELECT COUNT(*) FROM rounds").fetchone()[0]
+    assert rounds == WRITERS * ROUNDS_PER_WRITER
+    assert game.get_score_tree_node(score_store, game.SCORE_TREE_SIZE) == \
+        rounds
+
+
+def test_top_rounds(filled_store):
+    score_store, recorded = filled_store
+
+    top_rounds = game.get_top_rounds(score_store, 10)
+    top_scores = sorted((score for player, score in recorded),
+                        reverse=True)[:10]
+
+    assert [score for player, score, max_tile, moves in top_rounds] == \
+        top_scores
+
+
+def test_player_best(filled_store):
+    score_store, recorded = filled_store
+
+    for player in {player for player, score in recorded}:
+        assert game.get_player_best(score_store, player) == \
+            max(score for name, score in recorded if name == player)
+
+    assert game.get_player_best(score_store, "nobody") == 0
+
+
+def test_percentiles(filled_store):
+    score_store, recorded = filled_store
+    scores = sorted(score for player, score in recorded)
+
+    for score in [0, 4, scores[17], scores[100], 10000, 20000, 10 ** 9]:
+        lower = len([other for other in scores if other < score])
+        assert game.get_score_percentile(score_store, score) == \
+            pytest.approx(lower / len(scores) * 100)
+
+    for percentile in [0, 1, 25, 50, 90, 99.9, 100]:
+        rounds_needed = max(1, -(-len(scores) * percentile // 100))
+        assert game.get_percentile_score(score_store, percentile) == \
+            scores[int(rounds_needed) - 1]
+
+
+def test_store_queries_do_not_scan(filled_store):
+    score_store, recorded = filled_store
+    statements = []
+
+    # Capture the SQL the query functions really run, with their parameters.
+    score_store.set_trace_callback(statements.append)
+    game.get_score_percentile(score_store, 1000)
+    game.get_percentile_score(score_store, 50)
+    game.get_player_best(score_store, recorded[0][0])
+    game.get_top_rounds(score_store)
+    score_store.set_trace_callback(None)
+
+    for table in ["score_tree", "player_best", "rounds"]:
+        assert any(table in statement for statement in statements)
+
+    for statement in statements:
+        plan = score_store.execute("EXPLAIN QUERY PLAN " + statement
+                                   ).fetchall()
+        details = [row[-1] for row in plan]
+
+        # The leaderboard reads the score index in order, not the table.
+        assert all(not detail.startswith("SCAN") or
+                   "USING INDEX rounds_by_score" in detail
+                   for detail in details), (statement, details)
+
+
+def test_empty_store(tmp_path):
+    score_store = game.open_score_store(str(tmp_path / "scores.db"))
+
+    assert game.get_top_rounds(score_store) == []
+    assert game.get_score_percentile(score_store, 100) == 0.0
+    assert game.get_percentile_score(score_store, 50) == 0
+
+
+def test_move_count_only_counts_moves_that_change_the_board(monkeypatch,
+                                                             capsys):
+    record = play_scripted_round(monkeypatch, 6, game.MOVES_WASD, 200)
+    replayed = game.replay_game(record, {})
+
+    assert record["move_count"] < len(record["moves"])
+    assert not replayed["diverged"]
+
+
+def test_main_runs_without_a_score_store(monkeypatch, capsys, tmp_path):
+    keys = iter([game.PLAY, "q", "y", game.QUIT])
+    monkeypatch.setattr(game, "input", lambda prompt="": next(keys),
+                        raising=False)
+    monkeypatch.setattr(game, "sleep", lambda seconds: None)
+
+    game.main(str(tmp_path / "replays.jsonl"),
+              str(tmp_path / "missing" / "scores.db"))
+
+    output = capsys.readouterr().out
+    assert "Could not open the score store" in output
+    assert "Goodbye" in output
+
+
+def test_main_saves_scores_to_the_store(monkeypatch, capsys, tmp_path):
+    keys = iter([game.PLAY] + list("wasd" * 10) + ["q", "y", game.QUIT])
+    monkeypatch.setattr(game, "input", lambda prompt="": next(keys),
+                        raising=False)
+    monkeypatch.setattr(game, "sleep", lambda seconds: None)
+    monkeypatch.setattr(game, "get_player_name", lambda: "tester")
+    file_name = str(tmp_path / "scores.db")
+
+    game.main(str(tmp_path / "replays.jsonl"), file_name)
+
+    score_store = sqlite3.connect(file_name)
+    assert score_store.execute("""SELECT player FROM rounds""").fetchall() \
+        == [("tester",)]
+    score_store.close()